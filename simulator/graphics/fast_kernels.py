@@ -0,0 +1,57 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def light_sens_batch_numpy(xs, ys, mask, mask_x, mask_y, hits):
+    """
+    Looks up in the mask of the circuit the value under every
+    light sensor
+    Arguments:
+        xs: an array with the x coordinates of the sensors
+        ys: an array with the y coordinates of the sensors
+        mask: the rasterized circuit, 1 on the circuit and 0 outside
+        mask_x: the x coordinate of the top left corner of the mask
+        mask_y: the y coordinate of the top left corner of the mask
+        hits: an uint8 array where the values are written, one
+        for each sensor
+    Returns:
+        The hits array, 1 for the sensors over the circuit
+    """
+    height, width = mask.shape
+    # astype truncates towards 0, as int() does
+    x = xs.astype(np.int64) - mask_x
+    y = ys.astype(np.int64) - mask_y
+    inside = (0 <= x) & (x < width) & (0 <= y) & (y < height)
+    hits[:] = 0
+    hits[inside] = mask[y[inside], x[inside]]
+    return hits
+
+
+def light_sens_batch_loop(xs, ys, mask, mask_x, mask_y, hits):
+    """
+    Same as light_sens_batch_numpy, but with a loop over the
+    sensors, which numba compiles without temporary arrays
+    """
+    height, width = mask.shape
+    for i in range(len(xs)):
+        x = int(xs[i]) - mask_x
+        y = int(ys[i]) - mask_y
+        hits[i] = 0
+        if 0 <= x < width and 0 <= y < height:
+            hits[i] = mask[y, x]
+    return hits
+
+
+# Without numba, the loop would run in the interpreter
+light_sens_batch = light_sens_batch_numpy
+if njit is not None:
+    try:
+        light_sens_batch = njit(cache=True)(light_sens_batch_loop)
+    except RuntimeError:
+        # Caching fails if there is no writable directory for the
+        # cache, as in the bundled (PyInstaller) build
+        pass
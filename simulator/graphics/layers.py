@@ -1,3 +1,4 @@
+import numpy as np
 import graphics.drawing as drawing
 import graphics.robot_drawings as robot_drawings
 import graphics.huds as huds
@@ -5,6 +6,58 @@ import robot_components.robots as robots
 import files.files_reader as filesr
 
 
+def servo_vel(value):
+    """
+    Converts the value of a servo into the velocity of its wheel
+    Arguments:
+        value: the value of the servo (90 stopped, 0 and 180 full speed)
+    Returns:
+        The velocity, from -9 to 9 when the value is in [0, 180]
+    """
+    if isinstance(value, int) and 0 <= value <= 180:
+        return SERVO_VEL[value]
+    return int((value - 90) / 10)
+
+
+def servo_movement(v_i, v_r):
+    """
+    Calculates the movement of the mobile robot from the velocity
+    of its wheels
+    Arguments:
+        v_i: the velocity of the left wheel
+        v_r: the velocity of the right wheel
+    Returns:
+        A tuple (v, da) with the velocity and the angle
+    """
+    v = 0
+    da = 0
+    rotates = False
+    if v_i >= 0 and v_r >= 0:
+        if v_i != 0 or v_r != 0:
+            da = 5
+            rotates = True
+    if v_i <= 0 and v_r <= 0:
+        if v_i != 0 or v_r != 0:
+            da = -5
+            rotates = True
+    if abs(v_i) == abs(v_r) and not rotates:
+        if v_i > 0:
+            v = v_i * 2
+        if v_i < 0:
+            v = v_i * 2
+    return v, da
+
+
+# Velocity of a wheel for each value of its servo in [0, 180]
+SERVO_VEL = tuple(int((value - 90) / 10) for value in range(181))
+# Movement (v, da) for each pair of wheel velocities given by SERVO_VEL
+SERVO_MOVEMENT = {
+    (v_i, v_r): servo_movement(v_i, v_r)
+    for v_i in range(-9, 10)
+    for v_r in range(-9, 10)
+}
+
+
 class Layer:
 
     def __init__(self):
@@ -19,6 +72,9 @@ class Layer:
         self._zoom_percentage()
         self.is_drawing = False
         self.is_board = False
+        # The hud is only updated once every hud_every moves
+        self.tick = 0
+        self.hud_every = 4
 
         self.rdr = filesr.RobotDataReader()
 
@@ -29,6 +85,7 @@ class Layer:
         self._drawing_config()
         self.robot_drawing.draw()
         self.is_drawing = True
+        self.tick = 0
 
     def stop(self):
         """
@@ -52,6 +109,17 @@ class Layer:
         self.drawing.zoom_out()
         self._zoom_config()
 
+    def _hud_tick(self):
+        """
+        Advances the move counter and checks if the hud
+        has to be updated in this move
+        Returns:
+            True if the hud has to be updated, False if else
+        """
+        update = self.tick % self.hud_every == 0
+        self.tick += 1
+        return update
+
     def move(self, using_keys, move_WASD):
         """
         Moves the robot that is being used
@@ -122,6 +190,16 @@ class Layer:
 
 class MobileRobotLayer(Layer):
 
+    # Velocity and angle (v, da) given by the keys, indexed by
+    # (w << 3) | (s << 2) | (a << 1) | d. S wins over W and D over A
+    WASD_TABLE = tuple(
+        (
+            20 if code & 4 else -20 if code & 8 else 0,
+            -5 if code & 1 else 5 if code & 2 else 0
+        )
+        for code in range(16)
+    )
+
     def __init__(self, n_light_sens):
         """
         Constructor for MobileRobotLayer
@@ -136,11 +214,17 @@ class MobileRobotLayer(Layer):
             self.drawing, n_light_sens)
 
         self.n_sens = n_light_sens
+        self.light_values = np.zeros(n_light_sens, dtype=np.uint8)
+        self.obstacle_dists = None
 
         self.is_rotating = False
         self.is_moving = False
         self.circuit = None
         self.obstacle = None
+        self.sensors_dirty = True
+        self.__refresh_bounds_cache()
+        self.__recompute_obstacle_bounds()
+        self.__bind_robot_methods()
 
     def move(self, using_keys, move_WASD):
         """
@@ -153,29 +237,34 @@ class MobileRobotLayer(Layer):
         else:
             v, da = self.__move_code()
 
-        future_p = self.robot_drawing.predict_movement(v)
+        fx, fy = self.robot_predict_movement(v)
         if (
                 v == 0
-                or future_p[0] <= self.robot_drawing.width / 2
-                or future_p[0] >= self.robot_drawing.drawing_width - self.robot_drawing.width / 2
-                or future_p[1] <= self.robot_drawing.height / 2
-                or future_p[1] >= self.robot_drawing.drawing_height - self.robot_drawing.height / 2
-                or self.__check_obstacle_collision(future_p[0], future_p[1])
+                or fx <= self.half_w
+                or fx >= self.max_x
+                or fy <= self.half_h
+                or fy >= self.max_y
+                or self.__check_obstacle_collision(fx, fy)
         ):
             v = 0
             self.is_moving = False
         # Move or rotate
         if not self.is_rotating:
-            self.robot_drawing.move(v)
+            self.robot_move(v)
         if not self.is_moving:
-            self.robot_drawing.change_angle(da)
-        self.__hud_velocity()
+            self.robot_change_angle(da)
 
-        # Overlapping check
-        if self.circuit is not None:
-            self.__check_circuit_overlap()
-        if self.obstacle is not None:
-            self.__detect_obstacle()
+        # If the robot has not moved, the readings are the same
+        if v != 0 or da != 0 or self.sensors_dirty:
+            self.sensors_dirty = False
+            # Overlapping check
+            if self.circuit is not None:
+                self.__check_circuit_overlap()
+            if self.obstacle is not None:
+                self.__detect_obstacle()
+
+        if self._hud_tick():
+            self.__update_hud()
 
     def set_circuit(self, circuit_opt):
         """
@@ -201,6 +290,11 @@ class MobileRobotLayer(Layer):
         self.robot = robots.MobileRobot(self.n_sens, self.robot_data)
         self.robot_drawing = robot_drawings.MobileRobotDrawing(
             self.drawing, self.n_sens)
+        self.sensors_dirty = True
+        self.tick = 0
+        self.__refresh_bounds_cache()
+        self.__recompute_obstacle_bounds()
+        self.__bind_robot_methods()
 
     def __move_keys(self, movement):
         """
@@ -209,60 +303,33 @@ class MobileRobotLayer(Layer):
             movement: contains the information about the pressing
             of the keys
         """
+        code = (
+                (movement["w"] << 3) | (movement["s"] << 2)
+                | (movement["a"] << 1) | movement["d"]
+        )
+        key_v, key_da = self.WASD_TABLE[code]
         v = 0
         da = 0
         if not self.is_rotating:
-            if movement["w"]:
-                v = -20
-            if movement["s"]:
-                v = 20
-            if v != 0:
-                self.is_moving = True
-            else:
-                self.is_moving = False
+            v = key_v
+            self.is_moving = v != 0
         if not self.is_moving:
-            if movement["a"]:
-                da = 5
-            if movement["d"]:
-                da = -5
-            if da != 0:
-                self.is_rotating = True
-            else:
-                self.is_rotating = False
+            da = key_da
+            self.is_rotating = da != 0
         return v, da
 
     def __move_code(self):
         """
         Moves the robot using the programmed instructions
         """
-        v = 0
-        da = 0
-        # self.robot.servo_left.value = 0
-        # self.robot.servo_right.value = 0
-        v_i = int((self.robot.servo_left.get_value() - 90) / 10)
-        v_r = int((self.robot.servo_right.get_value() - 90) / 10)
-        rotates = False
-        if v_i >= 0 and v_r >= 0:
-            if v_i != 0 or v_r != 0:
-                da = 5
-                rotates = True
-        if v_i <= 0 and v_r <= 0:
-            if v_i != 0 or v_r != 0:
-                da = -5
-                rotates = True
-        if abs(v_i) == abs(v_r) and not rotates:
-            if v_i > 0:
-                v = v_i * 2
-            if v_i < 0:
-                v = v_i * 2
-        if v != 0:
-            self.is_moving = True
-        else:
-            self.is_moving = False
-        if da != 0:
-            self.is_rotating = True
-        else:
-            self.is_rotating = False
+        v_i = servo_vel(self.robot.servo_left.get_value())
+        v_r = servo_vel(self.robot.servo_right.get_value())
+        movement = SERVO_MOVEMENT.get((v_i, v_r))
+        if movement is None:
+            movement = servo_movement(v_i, v_r)
+        v, da = movement
+        self.is_moving = v != 0
+        self.is_rotating = da != 0
         return v, da
 
     def __parse_circuit_opt(self, circuit_opt):
@@ -295,6 +362,8 @@ class MobileRobotLayer(Layer):
         super()._drawing_config()
         self.__create_circuit()
         self.__create_obstacle()
+        # Executing starts with an empty hud, so the readings are shown again
+        self.sensors_dirty = True
 
     def _draw_before_robot(self):
         """
@@ -321,22 +390,21 @@ class MobileRobotLayer(Layer):
         """
         Checks if the robot is inside or outside of the circuit
         """
-        measurements = []
-        values = []
-        for sens in self.robot_drawing.sensors["light"]:
-            x = sens.x
-            y = sens.y
-            if self.circuit.is_overlapping(x, y):
+        hits = self.circuit.is_overlapping_vec(
+            self.robot_drawing.light_xy, self.light_values)
+        # Only the sensors that change are repainted
+        dirty = []
+        for i, (sens, hit) in enumerate(zip(self.robot_drawing.sensors["light"], hits)):
+            if hit == sens.is_dark:
+                continue
+            if hit:
                 sens.dark()
-                measurements.append(True)
-                values.append(1)
             else:
                 sens.light()
-                measurements.append(False)
-                values.append(0)
-        self.robot.set_light_sens_value(values)
-        self.robot_drawing.repaint_light_sensors()
-        self.hud.set_circuit(measurements)
+            dirty.append(i)
+        self.robot.set_light_sens_value(self.light_values)
+        if len(dirty) > 0:
+            self.robot_drawing.repaint_light_sensors(dirty)
 
     def __check_obstacle_collision(self, x, y):
         """
@@ -347,41 +415,74 @@ class MobileRobotLayer(Layer):
         Returns:
             True if collides, False if else
         """
-        if self.obstacle is None:
-            return False
         return (
-                x + self.robot_drawing.width / 2 >= self.obstacle.x
-                and y + self.robot_drawing.height / 2 >= self.obstacle.y
-                and x <= self.obstacle.x + (self.obstacle.width + self.robot_drawing.width / 2)
-                and y <= self.obstacle.y
-                + (self.obstacle.height + self.robot_drawing.height / 2)
+                self.obs_min_x <= x <= self.obs_max_x
+                and self.obs_min_y <= y <= self.obs_max_y
         )
 
+    def __bind_robot_methods(self):
+        """
+        Saves the methods of the robot drawing that are called on
+        every move, so they are not looked up each time. Has to be
+        called whenever the robot changes
+        """
+        self.robot_predict_movement = self.robot_drawing.predict_movement
+        self.robot_move = self.robot_drawing.move
+        self.robot_change_angle = self.robot_drawing.change_angle
+
+    def __refresh_bounds_cache(self):
+        """
+        Saves the limits of the drawing that the center of the robot
+        can reach, so they are not calculated on every move. Has to
+        be called whenever the robot changes
+        """
+        self.half_w = self.robot_drawing.width / 2
+        self.half_h = self.robot_drawing.height / 2
+        self.max_x = self.robot_drawing.drawing_width - self.half_w
+        self.max_y = self.robot_drawing.drawing_height - self.half_h
+
+    def __recompute_obstacle_bounds(self):
+        """
+        Computes the box of the obstacle grown by half of the robot
+        on each side, so the collision can be checked only with the
+        position of the robot. Has to be called whenever the obstacle
+        or the robot change
+        """
+        if self.obstacle is None:
+            # An empty box, no position collides
+            self.obs_min_x = self.obs_min_y = float("inf")
+            self.obs_max_x = self.obs_max_y = float("-inf")
+            return
+        self.obs_min_x = self.obstacle.x - self.half_w
+        self.obs_min_y = self.obstacle.y - self.half_h
+        self.obs_max_x = self.obstacle.x + (self.obstacle.width + self.half_w)
+        self.obs_max_y = self.obstacle.y + (self.obstacle.height + self.half_h)
+
     def __detect_obstacle(self):
         """
         Checks for every ultrasound sensor if it detects
-        any obstacle in front of it, and then sends the data
-        to the hud, so it can be parsed
-        """
-        dists = []
-        dists.append(self.obstacle.calculate_distance(self.robot_drawing.sensors["sound"].x,
-                                                      self.robot_drawing.sensors["sound"].y, self.robot_drawing.angle))
-        if dists[-1] != -1:
-            self.robot_drawing.sensors["sound"].set_detect(True)
-            self.robot.sound.value = 1
-            self.robot.sound.dist = dists[-1]
-        else:
-            self.robot_drawing.sensors["sound"].set_detect(False)
-            self.robot.sound.value = 0
-            self.robot.sound.dist = -1
-        self.hud.set_detect_obstacle(dists)
+        any obstacle in front of it, and keeps the distances
+        for the hud
+        """
+        sound = self.robot_drawing.sensors["sound"]
+        dists = self.obstacle.calculate_distance_batch(
+            [sound.x], [sound.y], [self.robot_drawing.angle])
+        detect = dists >= 0
+        sound.set_detect(bool(detect[0]))
+        self.robot.sound.value = int(detect[0])
+        self.robot.sound.dist = int(dists[0])
+        self.obstacle_dists = dists
 
-    def __hud_velocity(self):
+    def __update_hud(self):
         """
-        Sends the velocity data of the wheels to the hud,
-        so it can be parsed
+        Sends the velocity of the wheels and the last readings
+        of the sensors to the hud, so they can be parsed
         """
         self.hud.set_wheel([self.robot_drawing.vl, self.robot_drawing.vr])
+        if self.circuit is not None:
+            self.hud.set_circuit(self.light_values.view(np.bool_))
+        if self.obstacle is not None and self.obstacle_dists is not None:
+            self.hud.set_detect_obstacle(self.obstacle_dists.tolist())
 
 
 class ArduinoBoardLayer(Layer):
@@ -483,9 +584,10 @@ class LinearActuatorLayer(Layer):
         else:
             v = self.__move_code()
         self.robot_drawing.move(v)
-        self.hud.set_direction(v * 25)
-        self.hud.set_pressed(
-            [self.robot_drawing.but_left.pressed, self.robot_drawing.but_right.pressed])
+        if self._hud_tick():
+            self.hud.set_direction(v * 25)
+            self.hud.set_pressed(
+                [self.robot_drawing.but_left.pressed, self.robot_drawing.but_right.pressed])
 
     def __move_keys(self, movement):
         """
@@ -498,11 +600,11 @@ class LinearActuatorLayer(Layer):
         if movement["a"]:
             if self.robot_drawing.block.x > 508:
                 v -= 15
-            self.__hit_left(v == 0)
+            self.__hit(self.robot.button_left, v == 0)
         elif movement["d"]:
             if self.robot_drawing.block.x < 1912:
                 v += 15
-            self.__hit_right(v == 0)
+            self.__hit(self.robot.button_right, v == 0)
         return v
 
     def __move_code(self):
@@ -510,46 +612,30 @@ class LinearActuatorLayer(Layer):
         Moves the robot using the programmed instructions
         """
         v = 0
-        v_s = int((self.robot.servo.value - 90) / 10) * -1
+        v_s = -servo_vel(self.robot.servo.value)
         if v_s > 0:
             if self.robot_drawing.block.x < 1912:
                 v = v_s * 2
             else:
-                self.__hit_right(True)
+                self.__hit(self.robot.button_right, True)
         if v_s < 0:
             if self.robot_drawing.block.x > 508:
                 v = v_s * 2
             else:
-                self.__hit_left(True)
+                self.__hit(self.robot.button_left, True)
         if v != 0:
-            self.__hit_left(False)
-            self.__hit_right(False)
+            self.__hit(self.robot.button_left, False)
+            self.__hit(self.robot.button_right, False)
         return v
 
-    def __hit_left(self, has_hit):
-        """
-        Establishes the value for the left button
-        Arguments:
-            has_hit: True if the button has been hit, False
-            if else
-        """
-        if has_hit:
-            self.robot_drawing.hit = True
-            self.robot.button_left.value = 0
-        else:
-            self.robot_drawing.hit = False
-            self.robot.button_left.value = 1
-
-    def __hit_right(self, has_hit):
+    def __hit(self, button, has_hit):
         """
-        Establishes the value for the right button
+        Establishes the value for one of the end buttons. The button
+        reads 0 while it is being hit and 1 if else
         Arguments:
+            button: the button of the robot (left or right)
             has_hit: True if the button has been hit, False
             if else
         """
-        if has_hit:
-            self.robot_drawing.hit = True
-            self.robot.button_right.value = 0
-        else:
-            self.robot_drawing.hit = False
-            self.robot.button_right.value = 1
+        self.robot_drawing.hit = has_hit
+        button.value = int(not has_hit)
@@ -1,6 +1,8 @@
-from math import atan2, sqrt
+from math import atan2, ceil, floor, sqrt
 from math import cos, pi, sin
+import numpy as np
 import graphics.drawing as drawing
+import graphics.fast_kernels as fast_kernels
 import robot_components.boards as boards
 
 
@@ -271,6 +273,8 @@ class MobileRobotDrawing(RobotDrawing):
             self.y - 285,
             7630
         )
+        self.light_xy = np.empty((self.n_light_sens, 2), dtype=np.float32)
+        self.__update_light_xy()
 
     def draw(self):
         """
@@ -360,14 +364,18 @@ class MobileRobotDrawing(RobotDrawing):
             )
             self.__rotate_sensors(d_angle)
 
-    def repaint_light_sensors(self):
+    def repaint_light_sensors(self, indices=None):
         """
         Repaints the light sensors
+        Arguments:
+            indices: the indices of the sensors to repaint,
+            all of them if None
         """
-        i = 1
-        for sens in self.sensors["light"]:
-            self.drawing.redraw_image(sens.get_image(), "light_{}".format(i))
-            i += 1
+        if indices is None:
+            indices = range(len(self.sensors["light"]))
+        for i in indices:
+            self.drawing.redraw_image(
+                self.sensors["light"][i].get_image(), "light_{}".format(i + 1))
 
     def configure_distance(self, dist_sens):
         """
@@ -396,6 +404,7 @@ class MobileRobotDrawing(RobotDrawing):
         dx_sens = self.sensors["sound"].real_x + dx
         dy_sens = self.sensors["sound"].real_y + dy
         self.sensors["sound"].change_coords(dx_sens, dy_sens)
+        self.__update_light_xy()
         if self.__check_change_coords():
             self.x = int(self.real_x)
             self.y = int(self.real_y)
@@ -438,6 +447,15 @@ class MobileRobotDrawing(RobotDrawing):
             da
         )
         self.sensors["sound"].change_coords(self.x + x, self.y + y)
+        self.__update_light_xy()
+
+    def __update_light_xy(self):
+        """
+        Copies the coordinates of the light sensors into light_xy,
+        an array with one (x, y) row per sensor, so they can be
+        checked against the circuit all at once
+        """
+        self.light_xy[:] = [(sens.x, sens.y) for sens in self.sensors["light"]]
 
     def __rotate_center(self, tp, c, da):
         """
@@ -517,18 +535,21 @@ class MobileRobotDrawing(RobotDrawing):
             self.img_light = "assets/light-bright.png"
             self.img_dark = "assets/light-dark.png"
             self.img_shown = self.img_light
+            self.is_dark = False
 
         def light(self):
             """
             Changes the sensor to light
             """
             self.img_shown = self.img_light
+            self.is_dark = False
 
         def dark(self):
             """
             Changes the sensor to dark
             """
             self.img_shown = self.img_dark
+            self.is_dark = True
 
     class UltrasoundSensor(Sensor):
 
@@ -607,14 +628,51 @@ class Circuit:
         self.circuit_parts = []
         self.drawing = drawing
         self.ROAD_WIDTH = 100
+        self.mask = None
+        self.mask_x = 0
+        self.mask_y = 0
+
+        self.create_straights()
+        self.__create_mask()
 
     def create_circuit(self):
         """
-        Creates and draws a circuit
+        Draws the circuit. Its pieces are created only once, at the
+        constructor, so it can be redrawn (after zooming) without
+        creating them again
         """
-        self.create_straights()
         self.draw_circuit()
 
+    def __create_mask(self):
+        """
+        Rasterizes the circuit into a mask with one byte for each unit
+        of the drawing (1 on the circuit, 0 outside of it), so checking
+        a point is a single lookup. The mask only covers the bounding
+        box of the circuit, whose top left corner is (mask_x, mask_y)
+        """
+        bounds = [part.bounds() for part in self.circuit_parts]
+        if len(bounds) == 0:
+            self.mask = np.zeros((0, 0), dtype=np.uint8)
+            return
+        self.mask_x = floor(min(b[0] for b in bounds))
+        self.mask_y = floor(min(b[1] for b in bounds))
+        width = floor(max(b[2] for b in bounds)) - self.mask_x + 1
+        height = floor(max(b[3] for b in bounds)) - self.mask_y + 1
+        self.mask = np.zeros((height, width), dtype=np.uint8)
+        # Rows checked at once, so the temporary arrays of the
+        # biggest pieces stay small
+        block = 128
+        for part, (xmin, ymin, xmax, ymax) in zip(self.circuit_parts, bounds):
+            x0 = ceil(xmin)
+            x1 = floor(xmax) + 1
+            y1 = floor(ymax) + 1
+            cols = slice(x0 - self.mask_x, x1 - self.mask_x)
+            for y0 in range(ceil(ymin), y1, block):
+                y_end = min(y0 + block, y1)
+                ys, xs = np.ogrid[y0:y_end, x0:x1]
+                self.mask[y0 - self.mask_y:y_end - self.mask_y, cols] |= \
+                    part.check_overlap_vec(xs, ys)
+
     def create_straights(self):
         """
         Creates all the circuit pieces
@@ -867,12 +925,27 @@ class Circuit:
         Returns:
             True if is overlapping, False if else
         """
-        overlap = False
-        for part in self.circuit_parts:
-            overlap = part.check_overlap(x, y)
-            if overlap:
-                break
-        return overlap
+        x = int(x) - self.mask_x
+        y = int(y) - self.mask_y
+        height, width = self.mask.shape
+        return 0 <= x < width and 0 <= y < height and self.mask[y, x] == 1
+
+    def is_overlapping_vec(self, xy, out=None):
+        """
+        Checks which of the given points are overlapping with the circuit
+        Arguments:
+            xy: an array with one (x, y) row per point
+            out: an uint8 array to write the results into, so it
+            does not have to be created on every call
+        Returns:
+            A bool array (a view of out), True for the points that
+            are overlapping
+        """
+        if out is None:
+            out = np.empty(len(xy), dtype=np.uint8)
+        hits = fast_kernels.light_sens_batch(
+            xy[:, 0], xy[:, 1], self.mask, self.mask_x, self.mask_y, out)
+        return hits.view(np.bool_)
 
     class CircuitPart:
 
@@ -892,6 +965,13 @@ class Circuit:
             """
             pass
 
+        def bounds(self):
+            """
+            Returns the bounding box of the part, as a tuple
+            (xmin, ymin, xmax, ymax)
+            """
+            return (self.x, self.y, self.x, self.y)
+
         def check_overlap(self, x, y):
             """
             Checks if the point is overlapped with the
@@ -899,6 +979,20 @@ class Circuit:
             """
             pass
 
+        def check_overlap_vec(self, xs, ys):
+            """
+            Checks which of the points are overlapped with the
+            circuit
+            Arguments:
+                xs: an array with the x coordinates of the points
+                ys: an array with the y coordinates of the points,
+                which is broadcast against xs (a column of ys and a
+                row of xs check a whole grid)
+            Returns:
+                A bool array, True for the overlapped points
+            """
+            return np.zeros(np.broadcast(xs, ys).shape, dtype=np.bool_)
+
 
     class CircuitStraight(CircuitPart):
 
@@ -915,6 +1009,12 @@ class Circuit:
             self.width = width
             self.height = height
 
+        def bounds(self):
+            """
+            Returns the bounding box of the straight
+            """
+            return (self.x, self.y, self.x + self.width, self.y + self.height)
+
         def draw(self, drawing: drawing.Drawing):
             drawing.draw_rectangle(
                 {
@@ -942,6 +1042,16 @@ class Circuit:
                 )
             )
 
+        def check_overlap_vec(self, xs, ys):
+            """
+            Checks which of the points are overlapped with the
+            circuit
+            """
+            return (
+                (xs >= self.x) & (xs <= self.x + self.width)
+                & (ys >= self.y) & (ys <= self.y + self.height)
+            )
+
     class CircuitId(CircuitStraight):
 
             def __init__(self, x, y, width, height, number):
@@ -957,14 +1067,16 @@ class Circuit:
                 super().__init__(x, y, width, height)
                 self.number = number
 
+            def bounds(self):
+                """
+                Returns the bounding box of the id, including the
+                bits above and below it
+                """
+                return (self.x, self.y - 2 * self.height,
+                        self.x + self.width, self.y + 2 * self.height)
+
             def draw(self, drawing: drawing.Drawing):
-                temp = self.number
-                bits = []
-                for cont in range(3):
-                    bits.append((temp >> cont) % 2)
-                bits.append(0)
-                bits.reverse()
-                for cont, bit in enumerate(bits):
+                for cont, bit in enumerate(self.__bits()):
                     drawing.draw_rectangle(
                         {
                             "x": self.x + (2 * cont + 1) * self.width / 8,
@@ -986,10 +1098,13 @@ class Circuit:
                                 "group": "circuit"
                             }
                         )
-            def check_overlap(self, x, y):
+
+            def __bits(self):
                 """
-                Checks if the point is overlapped with the
-                circuit
+                Gets the bits of the id, as they are drawn (from left
+                to right, the first one is always 0)
+                Returns:
+                    A list with the four bits
                 """
                 temp = self.number
                 bits = []
@@ -997,7 +1112,14 @@ class Circuit:
                     bits.append((temp >> cont) % 2)
                 bits.append(0)
                 bits.reverse()
-                for cont, bit in enumerate(bits):
+                return bits
+
+            def check_overlap(self, x, y):
+                """
+                Checks if the point is overlapped with the
+                circuit
+                """
+                for cont, bit in enumerate(self.__bits()):
                     if ((self.x + (2 * cont + 1) * self.width / 8 <= x
                          <= self.x + (2 * cont + 2) * self.width / 8)
                         and
@@ -1013,6 +1135,28 @@ class Circuit:
                             return True
                 return False
 
+            def check_overlap_vec(self, xs, ys):
+                """
+                Checks which of the points are overlapped with the
+                circuit
+                """
+                in_bar = (self.y <= ys) & (ys <= self.y + self.height)
+                in_bit = (self.y - 2 * self.height <= ys) & (ys <= self.y + 2 * self.height)
+                overlap = np.zeros(np.broadcast(xs, ys).shape, dtype=np.bool_)
+                for cont, bit in enumerate(self.__bits()):
+                    overlap |= (
+                        (self.x + (2 * cont + 1) * self.width / 8 <= xs)
+                        & (xs <= self.x + (2 * cont + 2) * self.width / 8)
+                        & in_bar
+                    )
+                    if bit:
+                        overlap |= (
+                            (self.x + cont * self.width / 4 <= xs)
+                            & (xs <= self.x + (2 * cont + 1) * self.width / 8)
+                            & in_bit
+                        )
+                return overlap
+
     class CircuitTurn(CircuitPart):
 
         def __init__(self, x, y, width, height, angle, starting_angle, track_width):
@@ -1041,6 +1185,29 @@ class Circuit:
             self.center = (x + width / 2, y + height / 2)
             self.radius = sqrt((self.center[0] - x) ** 2)
 
+        def bounds(self):
+            """
+            Returns the bounding box of the turn. Only the part of the
+            ring covered by the arc is included: its ends, and the
+            outer points in the directions of the axes between them
+            """
+            r_in = self.radius - (self.track_width / 2)
+            r_out = self.radius + (self.track_width / 2)
+            end_angle = self.starting_angle + self.angle
+            if end_angle == 0:
+                end_angle = 360
+            # check_overlap never matches angles over 360
+            end_angle = min(end_angle, 360)
+            points = [(r, angle) for r in (r_in, r_out)
+                      for angle in (self.starting_angle, end_angle)]
+            points += [(r_out, angle) for angle in (0, 90, 180, 270, 360)
+                       if self.starting_angle <= angle <= end_angle]
+            xs = [self.center[0] + r * cos(angle * (pi / 180)) for r, angle in points]
+            ys = [self.center[1] - r * sin(angle * (pi / 180)) for r, angle in points]
+            # One more unit on each side, so the rounding of cos and
+            # sin does not leave out the points on the axes
+            return (min(xs) - 1, min(ys) - 1, max(xs) + 1, max(ys) + 1)
+
         def draw(self, drawing: drawing.Drawing):
             drawing.draw_arc(
                 {
@@ -1088,6 +1255,30 @@ class Circuit:
                 )
             return False
 
+        def check_overlap_vec(self, xs, ys):
+            """
+            Checks which of the points are overlapped with the turn
+            """
+            r_in = self.radius - (self.track_width / 2)
+            r_out = self.radius + (self.track_width / 2)
+
+            dx = xs - self.center[0]
+            dy = ys - self.center[1]
+            dist = np.sqrt(dx ** 2 + dy ** 2)
+
+            inside_angle = np.arctan2(dy, dx) * (180 / pi)
+            inside_angle[inside_angle < 0] += 360
+            inside_angle = np.abs(inside_angle - 360)
+            end_angle = self.starting_angle + self.angle
+            if end_angle == 0:
+                end_angle = 360
+            return (
+                (dist >= r_in) & (dist <= r_out)
+                & (inside_angle != 0)
+                & (self.starting_angle <= inside_angle)
+                & (inside_angle <= end_angle)
+            )
+
 
 class Obstacle:
 
@@ -1122,84 +1313,72 @@ class Obstacle:
 
     def calculate_distance(self, sx, sy, angle):
         """
-        Checks if is detected by the ultrasound sensor.
-        It does so by using the sin or cos (depending on
-        if it's x coordinate or y coordinate) and the coordinate.
-        With it, we have the distance, so we get a point with
-        the angle and the distance (and sin or cos, to get the
-        other coordinate). Can be done by using basic trigonometry
+        Checks if is detected by the ultrasound sensor, and
+        at which distance
         Arguments:
             sx: the x coordinate of the sensor
             sy: the y coordinate of the sensor
             angle: the angle of the line (from ox)
         Returns:
-            True if is detected, False if else
-        """
-        # Abs coords of obstacle
-        x1 = self.x - sx
-        x2 = self.x + self.width - sx
-        y1 = self.y - sy
-        y2 = self.y + self.height - sy
-        rads = angle * (pi / 180)
-
-        # Distance
-        if angle % 90 != 0 or angle % 180 == 0:
-            dist_x1 = int(abs(x1 / cos(rads)))
-            dist_x2 = int(abs(x2 / cos(rads)))
-        else:
-            dist_x1 = "inf"
-            dist_x2 = "inf"
-        if angle % 180 != 0:
-            dist_y1 = int(abs(y1 / sin(rads)))
-            dist_y2 = int(abs(y2 / sin(rads)))
-        else:
-            dist_y1 = "inf"
-            dist_y2 = "inf"
-
-        # Point distance
-        def dy(d, r):
-            return int(-sin(r) * d)
-
-        def dx(d, r):
-            return int(cos(r) * d)
-
-        dist = -1
-
-        # 10 coords in each point to ensure the fixed coord is inside
-        if dist_x1 != "inf":
-            px1 = (dx(dist_x1, rads), dy(dist_x1, rads))
-            if self.__check_inbounds(px1[0] + sx + 10, px1[1] + sy):
-                if dist == -1 or dist_x1 < dist:
-                    dist = dist_x1
-        if dist_x2 != "inf":
-            px2 = (dx(dist_x2, rads), dy(dist_x2, rads))
-            if self.__check_inbounds(px2[0] + sx - 10, px2[1] + sy):
-                if dist == -1 or dist_x2 < dist:
-                    dist = dist_x2
-        if dist_y1 != "inf":
-            py1 = (dx(dist_y1, rads), dy(dist_y1, rads))
-            if self.__check_inbounds(py1[0] + sx, py1[1] + sy + 10):
-                if dist == -1 or dist_y1 < dist:
-                    dist = dist_y1
-        if dist_y2 != "inf":
-            py2 = (dx(dist_y2, rads), dy(dist_y2, rads))
-            if self.__check_inbounds(py2[0] + sx, py2[1] + sy - 10):
-                if dist == -1 or dist_y2 < dist:
-                    dist = dist_y2
-
-        return dist
-
-    def __check_inbounds(self, x, y):
-        """
-        Checks if a point is inbounds of the obstacle (caution with
-        absolute coordinates)
+            The distance to the obstacle, -1 if it is not detected
+        """
+        return int(self.calculate_distance_batch([sx], [sy], [angle])[0])
+
+    def calculate_distance_batch(self, xs, ys, angles):
+        """
+        Checks for several ultrasound sensors at once if they detect
+        the obstacle. It does so with the slab method: the line of
+        each sensor is cut with the lines of the vertical sides and
+        with the ones of the horizontal sides of the obstacle, and
+        it is detected if both segments overlap in front of the sensor
         Arguments:
-            x: the x coordinate of the point
-            y: the y coordinate of the point
+            xs: the x coordinates of the sensors
+            ys: the y coordinates of the sensors
+            angles: the angles of the lines (from ox)
         Returns:
-            True if inbounds, False if else
-        """
-        return (
-            self.x <= x <= (self.x + self.width)
-            and self.y <= y <= (self.y + self.height)
-        )
+            An int array with the distance of each sensor to the
+            obstacle, 0 if the sensor is inside of it and -1 if it
+            is not detected
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        rads = np.asarray(angles, dtype=np.float64) * (pi / 180)
+        dir_x = np.cos(rads)
+        dir_y = -np.sin(rads)
+
+        tx_near, tx_far = self.__slab(xs, dir_x, self.x, self.x + self.width)
+        ty_near, ty_far = self.__slab(ys, dir_y, self.y, self.y + self.height)
+        t_near = np.maximum(tx_near, ty_near)
+        t_far = np.minimum(tx_far, ty_far)
+
+        # From inside of the obstacle (t_near < 0 <= t_far) it is
+        # touching the sensor, so the distance is 0
+        dists = np.maximum(t_near, 0)
+        detect = t_far >= dists
+        return np.where(detect, dists, -1).astype(np.int64)
+
+    def __slab(self, origins, direction, low, high):
+        """
+        Cuts the lines of the sensors with the space between two
+        parallel sides of the obstacle (a slab)
+        Arguments:
+            origins: the coordinates of the sensors in the axis
+            direction: the component of the lines in the axis
+            low: the coordinate of the first side
+            high: the coordinate of the second side
+        Returns:
+            Two arrays, with the distances along each line at which
+            it enters and at which it exits the slab
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t1 = (low - origins) / direction
+            t2 = (high - origins) / direction
+        t_in = np.minimum(t1, t2)
+        t_out = np.maximum(t1, t2)
+        # A line parallel to the sides is always inside of the slab
+        # if it is between them (borders included), and never if else
+        parallel = direction == 0
+        between = (low <= origins) & (origins <= high)
+        t_in = np.where(parallel, np.where(between, -np.inf, np.inf), t_in)
+        t_out = np.where(parallel, np.where(between, np.inf, -np.inf), t_out)
+        return t_in, t_out
@@ -136,10 +136,11 @@ class MobileRobot(Robot):
         """
         Sets the light sensor values
         Arguments:
-            values: the values to write into the sensors
+            values: the values to write into the sensors (a list
+            or an array)
         """
-        for i in range(0, len(self.light_sensors)):
-            self.light_sensors[i].value = values[i]
+        for sensor, value in zip(self.light_sensors, values):
+            sensor.value = int(value)
 
     def set_servo_left(self, pin):
         """
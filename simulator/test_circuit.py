@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+import files.files_reader as fr
+import graphics.fast_kernels as fk
+import graphics.robot_drawings as rd
+
+
+class TestBaseCircuit(unittest.TestCase):
+    # Distance between the points checked, and how far outside of
+    # the mask they go
+    step = 9
+    margin = 150
+
+    @classmethod
+    def setUpClass(cls):
+        parts = fr.RobotDataReader().parse_circuit(cls.name)[0]
+        cls.circuit = rd.Circuit(parts, None)
+        height, width = cls.circuit.mask.shape
+        xs = np.arange(cls.circuit.mask_x - cls.margin,
+                       cls.circuit.mask_x + width + cls.margin, cls.step)
+        ys = np.arange(cls.circuit.mask_y - cls.margin,
+                       cls.circuit.mask_y + height + cls.margin, cls.step)
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        cls.xy = np.column_stack((grid_x.ravel(), grid_y.ravel())).astype(np.float32)
+        # The geometry of the pieces, checked point by point
+        cls.expected = [
+            any(part.check_overlap(x, y) for part in cls.circuit.circuit_parts)
+            for x, y in cls.xy.tolist()
+        ]
+
+
+class TestCircuitMask(TestBaseCircuit):
+    name = "circuit"
+
+    def test_points_outside(self):
+        self.assertTrue(len(self.xy) > 0)
+        self.assertFalse(self.circuit.is_overlapping(-1000, -1000))
+        self.assertFalse(self.circuit.is_overlapping(100000, 100000))
+
+    def test_is_overlapping_vec(self):
+        self.assertTrue(any(self.expected))
+        hits = self.circuit.is_overlapping_vec(self.xy)
+        self.assertEqual(hits.tolist(), self.expected)
+
+    def test_is_overlapping(self):
+        hits = [self.circuit.is_overlapping(x, y) for x, y in self.xy.tolist()]
+        self.assertEqual(hits, self.expected)
+
+    def test_kernels(self):
+        expected = [int(hit) for hit in self.expected]
+        for kernel in (fk.light_sens_batch_numpy, fk.light_sens_batch_loop):
+            hits = np.empty(len(self.xy), dtype=np.uint8)
+            kernel(self.xy[:, 0], self.xy[:, 1], self.circuit.mask,
+                   self.circuit.mask_x, self.circuit.mask_y, hits)
+            self.assertEqual(hits.tolist(), expected)
+
+
+class TestLabyrinthMask(TestCircuitMask):
+    name = "labyrinth"
+
+
+class TestNodeCircuitMask(TestCircuitMask):
+    name = "node circuit"
+
+
+if __name__ == '__main__':
+    unittest.main()
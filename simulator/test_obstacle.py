@@ -0,0 +1,54 @@
+import unittest
+import graphics.robot_drawings as rd
+
+
+class TestObstacleDistance(unittest.TestCase):
+
+    def setUp(self):
+        # Same obstacle as the one of the "obstacle" circuit
+        self.obstacle = rd.Obstacle(
+            {"x": 900, "y": 900, "width": 1000, "height": 700}, None)
+
+    def test_in_front(self):
+        self.assertEqual(self.obstacle.calculate_distance(800, 1000, 0), 100)
+        self.assertEqual(self.obstacle.calculate_distance(2000, 1000, 180), 100)
+        self.assertEqual(self.obstacle.calculate_distance(1000, 800, 270), 100)
+        self.assertEqual(self.obstacle.calculate_distance(1000, 1700, 90), 100)
+
+    def test_not_in_line(self):
+        self.assertEqual(self.obstacle.calculate_distance(800, 800, 0), -1)
+        self.assertEqual(self.obstacle.calculate_distance(800, 1000, 90), -1)
+
+    def test_behind_sensor(self):
+        self.assertEqual(self.obstacle.calculate_distance(800, 1000, 180), -1)
+        self.assertEqual(self.obstacle.calculate_distance(2000, 1000, 0), -1)
+        self.assertEqual(self.obstacle.calculate_distance(1000, 800, 90), -1)
+        self.assertEqual(self.obstacle.calculate_distance(1000, 1700, 270), -1)
+
+    def test_grazing(self):
+        # Lines along the sides of the obstacle
+        self.assertEqual(self.obstacle.calculate_distance(800, 900, 0), 100)
+        self.assertEqual(self.obstacle.calculate_distance(800, 1600, 0), 100)
+        self.assertEqual(self.obstacle.calculate_distance(900, 1700, 90), 100)
+        self.assertEqual(self.obstacle.calculate_distance(1900, 800, 270), 100)
+        # Lines just outside of the sides
+        self.assertEqual(self.obstacle.calculate_distance(800, 899, 0), -1)
+        self.assertEqual(self.obstacle.calculate_distance(1901, 800, 270), -1)
+
+    def test_inside(self):
+        for angle in range(0, 360, 15):
+            self.assertEqual(
+                self.obstacle.calculate_distance(1000, 1000, angle), 0)
+        # Robot pressed against the obstacle and then rotated
+        for angle in range(165, 195, 5):
+            self.assertEqual(
+                self.obstacle.calculate_distance(1877, 999, angle), 0)
+
+    def test_batch(self):
+        dists = self.obstacle.calculate_distance_batch(
+            [800, 800, 1000], [1000, 1000, 1000], [0, 180, 45])
+        self.assertEqual(dists.tolist(), [100, -1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()